@@ -6,14 +6,15 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from config import ADMIN_IDS
-from utils.database import get_stats, get_all_videos, get_all_users, delete_video
+from config import DAILY_DOWNLOAD_LIMIT, SOURCE_CHANNEL_ID, TARGET_CHANNELS
+from utils.database import get_dashboard_stats, get_recent_videos, delete_video
 from utils.keyboard import get_admin_keyboard, get_main_menu_keyboard
-from utils.helpers import is_admin, format_number
+from utils.helpers import is_admin, format_number, skip_stale
 
 logger = logging.getLogger(__name__)
 
 
+@skip_stale(60)
 async def handle_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /panel command."""
     user_id = update.effective_user.id
@@ -29,6 +30,7 @@ async def handle_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@skip_stale(60)
 async def handle_admin_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle admin panel buttons."""
     user_id = update.effective_user.id
@@ -63,7 +65,7 @@ async def handle_admin_button(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def show_post_stats(update: Update):
     """Show post/video statistics."""
-    stats = get_stats()
+    stats = await get_dashboard_stats()
     
     text = f"""
 📊 **Post Statistics**
@@ -82,19 +84,13 @@ async def show_post_stats(update: Update):
 
 async def show_user_stats(update: Update):
     """Show user statistics."""
-    users = get_all_users()
-    stats = get_stats()
-    
-    # Count active today
-    from datetime import date
-    today = date.today().isoformat()
-    active_today = sum(1 for u in users.values() if u.get('last_download_date') == today)
-    
+    stats = await get_dashboard_stats()
+
     text = f"""
 👥 **User Statistics**
 
-📊 Total Users: {format_number(len(users))}
-🟢 Active Today: {format_number(active_today)}
+📊 Total Users: {format_number(stats.get('total_users', 0))}
+🟢 Active Today: {format_number(stats.get('active_today', 0))}
     """
     
     await update.message.reply_text(
@@ -106,37 +102,33 @@ async def show_user_stats(update: Update):
 
 async def show_video_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show recent videos with delete options."""
-    videos = get_all_videos()
-    
+    videos = await get_recent_videos(10)
+
     if not videos:
         await update.message.reply_text(
             "No videos yet.",
             reply_markup=get_admin_keyboard()
         )
         return
-    
+
     # Show last 10 videos with inline delete buttons
     text = "🎬 **Recent Videos:**\n\n"
-    
-    sorted_videos = sorted(
-        videos.items(), 
-        key=lambda x: x[1].get('created_at', ''), 
-        reverse=True
-    )[:10]
-    
+
     keyboard = []
-    
-    for vid_id, vid_data in sorted_videos:
-        title = vid_data.get('title', 'Untitled')[:25]
-        downloads = vid_data.get('downloads', 0)
+
+    for row in videos:
+        vid_id = row['video_id']
+        title = (row['title'] or 'Untitled')[:25]
+        downloads = row['downloads'] or 0
         text += f"• `{vid_id}` - {title}... ({downloads}📥)\n"
-        
+
         # Add delete button for each video
         keyboard.append([
             InlineKeyboardButton(f"🗑️ {vid_id}", callback_data=f"del_{vid_id}")
         ])
-    
-    text += f"\n_Total: {len(videos)} videos_\n\nClick to delete:"
+
+    stats = await get_dashboard_stats()
+    text += f"\n_Total: {stats.get('total_videos', 0)} videos_\n\nClick to delete:"
     
     keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="admin_back")])
     
@@ -168,7 +160,7 @@ async def handle_video_delete_callback(update: Update, context: ContextTypes.DEF
     
     if data.startswith("del_"):
         video_id = data.replace("del_", "")
-        success = delete_video(video_id)
+        success = await delete_video(video_id)
         
         if success:
             await query.edit_message_text(
@@ -183,7 +175,7 @@ async def handle_video_delete_callback(update: Update, context: ContextTypes.DEF
     
     elif data.startswith("confirm_del_"):
         video_id = data.replace("confirm_del_", "")
-        success = delete_video(video_id)
+        success = await delete_video(video_id)
         
         if success:
             await query.edit_message_text(
@@ -199,7 +191,7 @@ async def handle_video_delete_callback(update: Update, context: ContextTypes.DEF
 
 async def delete_video_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, video_id: str):
     """Handle video deletion from text command."""
-    success = delete_video(video_id)
+    success = await delete_video(video_id)
     
     if success:
         await update.message.reply_text(
@@ -216,8 +208,6 @@ async def delete_video_handler(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def show_settings(update: Update):
     """Show settings info."""
-    from config import DAILY_DOWNLOAD_LIMIT, SOURCE_CHANNEL_ID, TARGET_CHANNELS
-    
     text = f"""
 ⚙️ **Settings**
 
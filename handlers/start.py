@@ -2,82 +2,109 @@
 Start and verification handlers
 """
 
+import asyncio
 import logging
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
 from config import (
-    REQUIRED_CHANNELS, WELCOME_MESSAGE, SUCCESS_MESSAGE, 
+    REQUIRED_CHANNELS_TUPLE, WELCOME_MESSAGE, SUCCESS_MESSAGE,
     NOT_JOINED_MESSAGE, DAILY_DOWNLOAD_LIMIT, PREMIUM_USERS,
     LIMIT_REACHED_MESSAGE, VIDEO_NOT_FOUND_MESSAGE
 )
 from utils.database import has_join_request, remove_join_request, check_daily_limit, record_download, get_user
 from utils.keyboard import get_main_menu_keyboard, get_verification_keyboard
-from utils.helpers import extract_video_id
+from utils.helpers import extract_video_id, skip_stale
 from handlers.video import forward_video_to_user
 
 logger = logging.getLogger(__name__)
 
+# Membership results cached per (user_id, channel_id) to avoid repeated
+# getChatMember calls when users re-tap "Joined" or restart the bot
+MEMBER_CACHE_TTL = 60
+MEMBER_CACHE_MAX = 10_000
+_member_cache: dict = {}
+
+
+async def check_membership(bot, user_id: int, channel_id, force: bool = False) -> bool:
+    """Check if user is member of channel (cached for MEMBER_CACHE_TTL seconds)."""
+    key = (user_id, channel_id)
+
+    if not force:
+        cached = _member_cache.get(key)
+        if cached and time.monotonic() - cached[0] < MEMBER_CACHE_TTL:
+            return cached[1]
 
-async def check_membership(bot, user_id: int, channel_id) -> bool:
-    """Check if user is member of channel."""
     try:
         if isinstance(channel_id, str) and not channel_id.startswith('-'):
             chat_id = f"@{channel_id}"
         else:
             chat_id = channel_id
-        
+
         member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-        return member.status in ['member', 'administrator', 'creator', 'restricted']
+        is_member = member.status in ['member', 'administrator', 'creator', 'restricted']
     except TelegramError:
         return False
 
+    if len(_member_cache) >= MEMBER_CACHE_MAX:
+        # Simple FIFO eviction (dicts preserve insertion order)
+        _member_cache.pop(next(iter(_member_cache)))
+    _member_cache[key] = (time.monotonic(), is_member)
 
-async def check_channel(bot, user_id: int, channel_id, channel_info: dict) -> bool:
+    return is_member
+
+
+async def check_channel(bot, user_id: int, channel, force: bool = False) -> bool:
     """Check if user satisfies channel requirement."""
-    channel_type = channel_info.get("type", "public")
-    
-    if await check_membership(bot, user_id, channel_id):
-        remove_join_request(user_id, channel_id)
+    if await check_membership(bot, user_id, channel.id, force=force):
+        await remove_join_request(user_id, channel.id)
         return True
-    
-    if channel_type == "private":
-        return has_join_request(user_id, channel_id)
-    
+
+    if channel.type == "private":
+        return await has_join_request(user_id, channel.id)
+
     return False
 
 
-async def check_all_channels(bot, user_id: int) -> tuple[bool, list]:
-    """Check all required channels."""
-    not_joined = []
-    
-    for channel_id, channel_info in REQUIRED_CHANNELS.items():
-        if not await check_channel(bot, user_id, channel_id, channel_info):
-            not_joined.append(channel_id)
-    
+async def check_all_channels(bot, user_id: int, force: bool = False) -> tuple[bool, list]:
+    """Check all required channels concurrently."""
+    results = await asyncio.gather(*[
+        check_channel(bot, user_id, channel, force=force)
+        for channel in REQUIRED_CHANNELS_TUPLE
+    ], return_exceptions=True)
+
+    not_joined = [channel.id for channel, ok in zip(REQUIRED_CHANNELS_TUPLE, results) if ok is not True]
     return len(not_joined) == 0, not_joined
 
 
+# Static parts of the channel join buttons, computed once at import;
+# only the per-user joined/not-joined status varies per call
+_CHANNEL_BUTTON_BASE = tuple(
+    (channel.id,
+     "📩" if channel.type == "private" else "📢",
+     channel.name,
+     channel.link)
+    for channel in REQUIRED_CHANNELS_TUPLE
+)
+_VERIFY_ROW = [InlineKeyboardButton("✅ Joined", callback_data="verify")]
+
+
 def create_channel_buttons(not_joined: list = None) -> InlineKeyboardMarkup:
     """Create channel join buttons."""
     keyboard = []
-    
-    for channel_id, channel_info in REQUIRED_CHANNELS.items():
-        name = channel_info.get("name", str(channel_id))
-        link = channel_info.get("link")
-        typ = channel_info.get("type", "public")
-        
-        icon = "📩" if typ == "private" else "📢"
+
+    for channel_id, icon, name, link in _CHANNEL_BUTTON_BASE:
         status = "❌" if (not_joined and channel_id in not_joined) else "✅"
-        
         keyboard.append([InlineKeyboardButton(f"{status} {icon} {name}", url=link)])
-    
-    keyboard.append([InlineKeyboardButton("✅ Joined", callback_data="verify")])
-    
+
+    keyboard.append(_VERIFY_ROW)
+
     return InlineKeyboardMarkup(keyboard)
 
 
+@skip_stale(60)
 async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command."""
     user_id = update.effective_user.id
@@ -89,7 +116,7 @@ async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         video_id = extract_video_id(args[0])
     
     # Check channel verification
-    if REQUIRED_CHANNELS:
+    if REQUIRED_CHANNELS_TUPLE:
         all_ok, not_joined = await check_all_channels(context.bot, user_id)
         
         if not all_ok:
@@ -120,10 +147,11 @@ async def deliver_video(update, context, user_id: int, video_id: str):
     
     # Check daily limit
     is_premium = user_id in PREMIUM_USERS
-    
+    remaining = 0
+
     if not is_premium:
-        allowed, remaining = check_daily_limit(user_id, DAILY_DOWNLOAD_LIMIT)
-        
+        allowed, remaining = await check_daily_limit(user_id, DAILY_DOWNLOAD_LIMIT)
+
         if not allowed:
             await update.message.reply_text(
                 LIMIT_REACHED_MESSAGE.format(limit=DAILY_DOWNLOAD_LIMIT),
@@ -135,13 +163,14 @@ async def deliver_video(update, context, user_id: int, video_id: str):
     success = await forward_video_to_user(context.bot, user_id, video_id)
     
     if success:
-        record_download(user_id)
-        
-        # Show remaining downloads
+        await record_download(user_id)
+
+        # Show remaining downloads (derived from the pre-send check
+        # instead of asking the DB again)
         if not is_premium:
-            _, remaining = check_daily_limit(user_id, DAILY_DOWNLOAD_LIMIT)
+            remaining_after = remaining - 1
             await update.message.reply_text(
-                f"✅ Video sent!\n\n📊 Today's remaining: {remaining}/{DAILY_DOWNLOAD_LIMIT}",
+                f"✅ Video sent!\n\n📊 Today's remaining: {remaining_after}/{DAILY_DOWNLOAD_LIMIT}",
                 reply_markup=get_main_menu_keyboard()
             )
         else:
@@ -163,8 +192,9 @@ async def handle_verify_callback(update: Update, context: ContextTypes.DEFAULT_T
     user_id = query.from_user.id
     
     await query.answer()
-    
-    all_ok, not_joined = await check_all_channels(context.bot, user_id)
+
+    # Bypass the membership cache so a fresh join is seen immediately
+    all_ok, not_joined = await check_all_channels(context.bot, user_id, force=True)
     
     if all_ok:
         # Check if there's a pending video
@@ -191,6 +221,7 @@ async def handle_verify_callback(update: Update, context: ContextTypes.DEFAULT_T
         )
 
 
+@skip_stale(60)
 async def handle_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command."""
     help_text = """
@@ -7,13 +7,15 @@ from telegram import Update
 from telegram.ext import ContextTypes
 
 from config import DAILY_DOWNLOAD_LIMIT, PREMIUM_USERS
+from handlers.start import handle_start, handle_help
 from utils.database import get_user, check_daily_limit
 from utils.keyboard import get_main_menu_keyboard
-from utils.helpers import format_number
+from utils.helpers import format_number, skip_stale
 
 logger = logging.getLogger(__name__)
 
 
+@skip_stale(60)
 async def handle_user_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle user menu buttons."""
     text = update.message.text
@@ -29,12 +31,10 @@ async def handle_user_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await handle_profile(update, context)
     
     elif text == "❓ Help":
-        from handlers.start import handle_help
         await handle_help(update, context)
-    
+
     elif text == "✅ I've Joined":
         # Re-trigger verification
-        from handlers.start import handle_start
         await handle_start(update, context)
 
 
@@ -51,10 +51,10 @@ async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle my stats button."""
     user_id = update.effective_user.id
-    user = get_user(user_id)
-    
+    user = await get_user(user_id)
+
     is_premium = user_id in PREMIUM_USERS
-    _, remaining = check_daily_limit(user_id, DAILY_DOWNLOAD_LIMIT)
+    _, remaining = await check_daily_limit(user_id, DAILY_DOWNLOAD_LIMIT)
     
     status = "⭐ Premium" if is_premium else "👤 Regular"
     limit_text = "Unlimited" if is_premium else f"{remaining}/{DAILY_DOWNLOAD_LIMIT}"
@@ -78,7 +78,7 @@ async def handle_my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle profile button."""
     user = update.effective_user
-    user_data = get_user(user.id)
+    user_data = await get_user(user.id)
     
     is_premium = user.id in PREMIUM_USERS
     status = "⭐ Premium Member" if is_premium else "👤 Regular Member"
@@ -1,258 +1,324 @@
-"""
-Video handler - detects videos in source channel and posts to target channels
-
-Supports 2 methods:
-1. Media Group: Photo + Video posted together → Immediately posts
-2. Reply Method: Video/Photo posted first, then reply with Photo/Video → Posts when pair complete
-
-Single video/photo without pair will be STORED but NOT posted until paired via reply.
-"""
-
-import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
-from telegram.error import TelegramError
-
-from config import SOURCE_CHANNEL_ID, TARGET_CHANNELS
-from utils.database import save_video, get_video, increment_downloads
-from utils.helpers import sanitize_title
-
-logger = logging.getLogger(__name__)
-
-# Store media group data temporarily
-media_groups = {}
-
-# Store unpaired posts (waiting for reply to complete pair)
-# {message_id: {type, file_id, caption, chat_id, message_id}}
-pending_posts = {}
-
-
-async def handle_channel_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle new posts in source channel."""
-    message = update.channel_post
-    
-    if not message:
-        return
-    
-    # Check if from source channel
-    if SOURCE_CHANNEL_ID and message.chat.id != SOURCE_CHANNEL_ID:
-        return
-    
-    # Method 1: Media Group (Photo + Video together) - Post immediately
-    if message.media_group_id:
-        await handle_media_group(update, context)
-        return
-    
-    # Method 2: Reply - Check if this is a reply to complete a pair
-    if message.reply_to_message:
-        await handle_reply_method(update, context)
-        return
-    
-    # Single post without reply - STORE but do NOT post
-    if message.video:
-        pending_posts[message.message_id] = {
-            "type": "video",
-            "file_id": message.video.file_id,
-            "message_id": message.message_id,
-            "chat_id": message.chat.id,
-            "caption": message.caption
-        }
-        logger.info(f"Video STORED (waiting for reply): msg_id={message.message_id}")
-    
-    elif message.photo:
-        pending_posts[message.message_id] = {
-            "type": "photo",
-            "file_id": message.photo[-1].file_id,
-            "message_id": message.message_id,
-            "chat_id": message.chat.id,
-            "caption": message.caption
-        }
-        logger.info(f"Photo STORED (waiting for reply): msg_id={message.message_id}")
-
-
-async def handle_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Method 1: Handle media group (Photo + Video together) - Posts immediately."""
-    message = update.channel_post
-    group_id = message.media_group_id
-    
-    if group_id not in media_groups:
-        media_groups[group_id] = {
-            "photo": None,
-            "video_file_id": None,
-            "video_message_id": None,
-            "caption": None,
-            "chat_id": message.chat.id
-        }
-    
-    group = media_groups[group_id]
-    
-    if message.photo:
-        group["photo"] = message.photo[-1].file_id
-        if message.caption:
-            group["caption"] = message.caption
-        logger.info(f"Media group {group_id}: Photo received")
-    
-    if message.video:
-        group["video_file_id"] = message.video.file_id
-        group["video_message_id"] = message.message_id
-        if message.caption:
-            group["caption"] = message.caption
-        logger.info(f"Media group {group_id}: Video received")
-    
-    # Process when both available
-    if group["photo"] and group["video_file_id"]:
-        logger.info(f"Media group {group_id}: COMPLETE - posting...")
-        
-        title = sanitize_title(group["caption"])
-        
-        video_id = save_video(
-            source_channel=group["chat_id"],
-            message_id=group["video_message_id"],
-            title=title,
-            thumbnail_id=group["photo"]
-        )
-        
-        await post_to_channels(context.bot, video_id, title, thumbnail_photo_id=group["photo"])
-        del media_groups[group_id]
-
-
-async def handle_reply_method(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Method 2: Handle Reply to complete pairs.
-    
-    Supports:
-    - Photo reply to Video → Photo = Thumbnail
-    - Video reply to Photo → Photo = Thumbnail
-    - Video reply to Video → Second Video's thumbnail = Thumbnail, First Video = Content
-    """
-    message = update.channel_post
-    replied_to = message.reply_to_message
-    replied_msg_id = replied_to.message_id
-    
-    logger.info(f"Reply detected to message {replied_msg_id}")
-    
-    thumbnail_id = None
-    content_video_message_id = None
-    caption = None
-    
-    # Get the replied-to message data (either from pending_posts or direct)
-    replied_data = pending_posts.get(replied_msg_id)
-    
-    # Case 1: Current message is a VIDEO replying to something
-    if message.video:
-        caption = message.caption or (replied_to.caption if replied_to else None)
-        
-        # Check what was replied to
-        if replied_to.photo:
-            # Video reply to Photo → Photo = Thumbnail, This Video = Content
-            thumbnail_id = replied_to.photo[-1].file_id
-            content_video_message_id = message.message_id
-            
-        elif replied_data and replied_data["type"] == "photo":
-            # Video reply to stored Photo
-            thumbnail_id = replied_data["file_id"]
-            content_video_message_id = message.message_id
-            if not caption:
-                caption = replied_data.get("caption")
-                
-        elif replied_to.video:
-            # Video reply to Video → Second Video's thumbnail = Thumbnail, First Video = Content
-            # Get thumbnail from second video (current message)
-            if message.video.thumbnail:
-                thumbnail_id = message.video.thumbnail.file_id
-            content_video_message_id = replied_to.message_id  # First video is content
-            
-        elif replied_data and replied_data["type"] == "video":
-            # Video reply to stored Video
-            if message.video.thumbnail:
-                thumbnail_id = message.video.thumbnail.file_id
-            content_video_message_id = replied_data["message_id"]  # First video is content
-            if not caption:
-                caption = replied_data.get("caption")
-    
-    # Case 2: Current message is a PHOTO replying to something
-    elif message.photo:
-        thumbnail_id = message.photo[-1].file_id
-        caption = message.caption or (replied_to.caption if replied_to else None)
-        
-        # Check if replied message is a video
-        if replied_to.video:
-            content_video_message_id = replied_to.message_id
-        elif replied_data and replied_data["type"] == "video":
-            content_video_message_id = replied_data["message_id"]
-            if not caption:
-                caption = replied_data.get("caption")
-    
-    # If we have both thumbnail and video - POST!
-    if thumbnail_id and content_video_message_id:
-        logger.info("Reply method: Pair COMPLETE - posting...")
-        
-        title = sanitize_title(caption)
-        
-        video_id = save_video(
-            source_channel=message.chat.id,
-            message_id=content_video_message_id,
-            title=title,
-            thumbnail_id=thumbnail_id
-        )
-        
-        await post_to_channels(context.bot, video_id, title, thumbnail_photo_id=thumbnail_id)
-        
-        # Clean up pending
-        if replied_msg_id in pending_posts:
-            del pending_posts[replied_msg_id]
-            logger.info(f"Cleaned up pending post {replied_msg_id}")
-    else:
-        logger.info("Reply method: Incomplete pair - need thumbnail and video")
-
-
-async def post_to_channels(bot, video_id: str, title: str, thumbnail_photo_id: str):
-    """Post video preview with photo thumbnail to all target channels."""
-    
-    if not TARGET_CHANNELS:
-        logger.warning("No target channels configured")
-        return
-    
-    bot_username = (await bot.get_me()).username
-    button_url = f"https://t.me/{bot_username}?start={video_id}"
-    
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📥 Get Video", url=button_url)]
-    ])
-    
-    post_caption = f"🎬 <b>{title}</b>\n\n📥 নিচে ক্লিক করে ভিডিও নিন!"
-    
-    for channel in TARGET_CHANNELS:
-        channel_id = channel.get("id")
-        channel_name = channel.get("name", "Unknown")
-        
-        try:
-            await bot.send_photo(
-                chat_id=channel_id,
-                photo=thumbnail_photo_id,
-                caption=post_caption,
-                reply_markup=keyboard,
-                parse_mode='HTML'
-            )
-            logger.info(f"Posted to {channel_name} ✓")
-        except TelegramError as e:
-            logger.error(f"Failed to post to {channel_name}: {e}")
-
-
-async def forward_video_to_user(bot, user_id: int, video_id: str) -> bool:
-    """Forward video from source channel to user."""
-    video_data = get_video(video_id)
-    
-    if not video_data:
-        return False
-    
-    try:
-        await bot.forward_message(
-            chat_id=user_id,
-            from_chat_id=video_data["source_channel"],
-            message_id=video_data["message_id"]
-        )
-        increment_downloads(video_id)
-        return True
-    except TelegramError as e:
-        logger.error(f"Failed to forward video: {e}")
-        return False
+"""
+Video handler - detects videos in source channel and posts to target channels
+
+Supports 2 methods:
+1. Media Group: Photo + Video posted together → Immediately posts
+2. Reply Method: Video/Photo posted first, then reply with Photo/Video → Posts when pair complete
+
+Single video/photo without pair will be STORED but NOT posted until paired via reply.
+"""
+
+import asyncio
+import logging
+import time
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from telegram.error import TelegramError
+
+from config import SOURCE_CHANNEL_ID, TARGET_CHANNELS
+from utils.database import save_video, get_video, increment_downloads, generate_video_id
+from utils.helpers import sanitize_title
+from utils.ratelimit import send_limited
+
+logger = logging.getLogger(__name__)
+
+# Bot username is immutable for the process lifetime; fetched once
+_bot_username = None
+
+# Store media group data temporarily
+media_groups = {}
+
+# Store unpaired posts (waiting for reply to complete pair)
+# {message_id: {type, file_id, caption, chat_id, message_id, ts}}
+pending_posts = {}
+
+# Both buffers only shrank on the happy path, so orphaned halves (a
+# photo whose video never arrives) leaked forever. Entries carry a
+# monotonic "ts" and are pruned on insert.
+PENDING_TTL = 300
+PENDING_MAX = 10_000
+
+
+def _prune(buffer: dict):
+    """Drop expired entries and cap buffer size (oldest first)."""
+    now = time.monotonic()
+    stale = [key for key, entry in buffer.items() if now - entry["ts"] > PENDING_TTL]
+    for key in stale:
+        del buffer[key]
+
+    while len(buffer) >= PENDING_MAX:
+        buffer.pop(next(iter(buffer)))
+
+
+async def handle_channel_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle new posts in source channel."""
+    message = update.channel_post
+    
+    if not message:
+        return
+    
+    # Check if from source channel
+    if SOURCE_CHANNEL_ID and message.chat.id != SOURCE_CHANNEL_ID:
+        return
+    
+    # Method 1: Media Group (Photo + Video together) - Post immediately
+    if message.media_group_id:
+        await handle_media_group(update, context)
+        return
+    
+    # Method 2: Reply - Check if this is a reply to complete a pair
+    if message.reply_to_message:
+        await handle_reply_method(update, context)
+        return
+    
+    # Single post without reply - STORE but do NOT post
+    if message.video:
+        _prune(pending_posts)
+        pending_posts[message.message_id] = {
+            "type": "video",
+            "file_id": message.video.file_id,
+            "message_id": message.message_id,
+            "chat_id": message.chat.id,
+            "caption": message.caption,
+            "ts": time.monotonic()
+        }
+        logger.info("Video STORED (waiting for reply): msg_id=%s", message.message_id)
+
+    elif message.photo:
+        _prune(pending_posts)
+        pending_posts[message.message_id] = {
+            "type": "photo",
+            "file_id": message.photo[-1].file_id,
+            "message_id": message.message_id,
+            "chat_id": message.chat.id,
+            "caption": message.caption,
+            "ts": time.monotonic()
+        }
+        logger.info("Photo STORED (waiting for reply): msg_id=%s", message.message_id)
+
+
+# How long to wait after the first item of a group before posting;
+# Telegram delivers a group's updates within a second or two
+MEDIA_GROUP_SETTLE = 1.5
+
+
+async def handle_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Method 1: Buffer media group items and post once the group settles.
+
+    All items are collected in arrival order; a single timer started on
+    the first item flushes the group, so groups with extra photos/videos
+    are handled instead of racing on the first photo+video pair.
+    """
+    message = update.channel_post
+    group_id = message.media_group_id
+
+    group = media_groups.get(group_id)
+    if group is None:
+        _prune(media_groups)
+        group = media_groups[group_id] = {
+            "items": [],
+            "chat_id": message.chat.id,
+            "ts": time.monotonic()
+        }
+        # One timer per group, scheduled on first arrival
+        asyncio.create_task(_finalize_media_group(group_id, context))
+
+    group["items"].append(message)
+    logger.info("Media group %s: item %s buffered", group_id, message.message_id)
+
+
+async def _finalize_media_group(group_id, context: ContextTypes.DEFAULT_TYPE):
+    """Post a buffered media group after it has settled."""
+    await asyncio.sleep(MEDIA_GROUP_SETTLE)
+
+    group = media_groups.pop(group_id, None)
+    if not group:
+        return
+
+    # First photo is the thumbnail, first video is the content
+    photo_id = None
+    video_message_id = None
+    caption = None
+
+    for message in group["items"]:
+        if photo_id is None and message.photo:
+            photo_id = message.photo[-1].file_id
+        if video_message_id is None and message.video:
+            video_message_id = message.message_id
+        if caption is None and message.caption:
+            caption = message.caption
+
+    if not (photo_id and video_message_id):
+        logger.info("Media group %s: incomplete (need photo + video) - dropped", group_id)
+        return
+
+    logger.info("Media group %s: COMPLETE - posting...", group_id)
+
+    title = sanitize_title(caption)
+
+    # Generate the id up front so the DB insert and the channel fan-out
+    # can overlap instead of serializing
+    video_id = generate_video_id()
+    await asyncio.gather(
+        save_video(
+            source_channel=group["chat_id"],
+            message_id=video_message_id,
+            title=title,
+            thumbnail_id=photo_id,
+            video_id=video_id
+        ),
+        post_to_channels(context.bot, video_id, title, thumbnail_photo_id=photo_id)
+    )
+
+
+def _classify_replied(replied_to, replied_data):
+    """Classify the replied-to message as (kind, file_id, message_id, caption)."""
+    if replied_to.photo:
+        return "photo", replied_to.photo[-1].file_id, replied_to.message_id, replied_to.caption
+    if replied_to.video:
+        return "video", None, replied_to.message_id, replied_to.caption
+    if replied_data:
+        return replied_data["type"], replied_data["file_id"], replied_data["message_id"], replied_data.get("caption")
+    return None, None, None, None
+
+
+def _resolve_video_photo(message, rep_file_id, rep_mid):
+    # Video reply to Photo → Photo = Thumbnail, This Video = Content
+    return rep_file_id, message.message_id
+
+
+def _resolve_video_video(message, rep_file_id, rep_mid):
+    # Video reply to Video → Second Video's thumbnail = Thumbnail, First Video = Content
+    thumbnail = message.video.thumbnail
+    return (thumbnail.file_id if thumbnail else None), rep_mid
+
+
+def _resolve_photo_video(message, rep_file_id, rep_mid):
+    # Photo reply to Video → Photo = Thumbnail
+    return message.photo[-1].file_id, rep_mid
+
+
+# (current kind, replied kind) -> resolver returning (thumbnail_id,
+# content_video_message_id); pairs not listed can't form a post
+_REPLY_DISPATCH = {
+    ("video", "photo"): _resolve_video_photo,
+    ("video", "video"): _resolve_video_video,
+    ("photo", "video"): _resolve_photo_video,
+}
+
+
+async def handle_reply_method(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Method 2: Handle Reply to complete pairs.
+
+    Supports:
+    - Photo reply to Video → Photo = Thumbnail
+    - Video reply to Photo → Photo = Thumbnail
+    - Video reply to Video → Second Video's thumbnail = Thumbnail, First Video = Content
+    """
+    message = update.channel_post
+    replied_to = message.reply_to_message
+    replied_msg_id = replied_to.message_id
+
+    logger.info("Reply detected to message %s", replied_msg_id)
+
+    # Get the replied-to message data (either from pending_posts or direct)
+    replied_data = pending_posts.get(replied_msg_id)
+
+    current_kind = "video" if message.video else "photo" if message.photo else None
+    replied_kind, rep_file_id, rep_mid, rep_caption = _classify_replied(replied_to, replied_data)
+
+    thumbnail_id = None
+    content_video_message_id = None
+
+    resolver = _REPLY_DISPATCH.get((current_kind, replied_kind))
+    if resolver:
+        thumbnail_id, content_video_message_id = resolver(message, rep_file_id, rep_mid)
+
+    caption = message.caption or rep_caption
+
+    # If we have both thumbnail and video - POST!
+    if thumbnail_id and content_video_message_id:
+        logger.info("Reply method: Pair COMPLETE - posting...")
+        
+        title = sanitize_title(caption)
+
+        video_id = generate_video_id()
+        await asyncio.gather(
+            save_video(
+                source_channel=message.chat.id,
+                message_id=content_video_message_id,
+                title=title,
+                thumbnail_id=thumbnail_id,
+                video_id=video_id
+            ),
+            post_to_channels(context.bot, video_id, title, thumbnail_photo_id=thumbnail_id)
+        )
+        
+        # Clean up pending
+        if replied_msg_id in pending_posts:
+            del pending_posts[replied_msg_id]
+            logger.info("Cleaned up pending post %s", replied_msg_id)
+    else:
+        logger.info("Reply method: Incomplete pair - need thumbnail and video")
+
+
+async def post_to_channels(bot, video_id: str, title: str, thumbnail_photo_id: str):
+    """Post video preview with photo thumbnail to all target channels."""
+    
+    if not TARGET_CHANNELS:
+        logger.warning("No target channels configured")
+        return
+    
+    global _bot_username
+    if _bot_username is None:
+        _bot_username = (await bot.get_me()).username
+
+    button_url = f"https://t.me/{_bot_username}?start={video_id}"
+    
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📥 Get Video", url=button_url)]
+    ])
+    
+    post_caption = f"🎬 <b>{title}</b>\n\n📥 নিচে ক্লিক করে ভিডিও নিন!"
+
+    async def _send_one(channel):
+        channel_id = channel.get("id")
+        channel_name = channel.get("name", "Unknown")
+
+        try:
+            await send_limited(
+                bot.send_photo,
+                channel_id,
+                photo=thumbnail_photo_id,
+                caption=post_caption,
+                reply_markup=keyboard,
+                parse_mode='HTML'
+            )
+            logger.info("Posted to %s ✓", channel_name)
+        except TelegramError as e:
+            logger.error("Failed to post to %s: %s", channel_name, e)
+
+    # All channels in parallel; one slow or failing channel doesn't
+    # delay the others
+    await asyncio.gather(*(_send_one(channel) for channel in TARGET_CHANNELS))
+
+
+async def forward_video_to_user(bot, user_id: int, video_id: str) -> bool:
+    """Forward video from source channel to user."""
+    video_data = await get_video(video_id)
+    
+    if not video_data:
+        return False
+    
+    try:
+        await send_limited(
+            bot.forward_message,
+            user_id,
+            from_chat_id=video_data["source_channel"],
+            message_id=video_data["message_id"]
+        )
+        await increment_downloads(video_id)
+        return True
+    except TelegramError as e:
+        logger.error("Failed to forward video: %s", e)
+        return False
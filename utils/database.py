@@ -1,314 +1,421 @@
-"""
-Database utilities for PostgreSQL (Neon) storage
-With connection pooling and auto-reconnect
-"""
-
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2 import pool
-from contextlib import contextmanager
-from datetime import datetime, date
-from typing import Optional, Dict
-import secrets
-import string
-import logging
-
-from config import DATABASE_URL
-
-logger = logging.getLogger(__name__)
-
-# Connection pool
-_pool = None
-
-
-def get_pool():
-    """Get connection pool."""
-    global _pool
-    if _pool is None:
-        _pool = pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=10,
-            dsn=DATABASE_URL
-        )
-        logger.info("Database connection pool created")
-    return _pool
-
-
-@contextmanager
-def get_db():
-    """Get database connection context manager."""
-    conn = None
-    try:
-        conn = get_pool().getconn()
-        conn.autocommit = True
-        yield conn
-    except Exception as e:
-        logger.error(f"Database error: {e}")
-        global _pool
-        _pool = None  # Reset pool on error
-        raise
-    finally:
-        if conn:
-            try:
-                get_pool().putconn(conn)
-            except:
-                pass
-
-
-def init_database():
-    """Initialize database tables."""
-    with get_db() as conn:
-        cur = conn.cursor()
-        
-        # Create videos table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS videos (
-                video_id VARCHAR(20) PRIMARY KEY,
-                source_channel BIGINT NOT NULL,
-                message_id BIGINT NOT NULL,
-                title VARCHAR(255),
-                thumbnail_id VARCHAR(255),
-                downloads INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create users table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                joined_at DATE DEFAULT CURRENT_DATE,
-                downloads_today INTEGER DEFAULT 0,
-                last_download_date DATE,
-                total_downloads INTEGER DEFAULT 0,
-                is_premium BOOLEAN DEFAULT FALSE
-            )
-        """)
-        
-        # Create join_requests table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS join_requests (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                channel_id VARCHAR(100) NOT NULL,
-                requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, channel_id)
-            )
-        """)
-        
-        # Create stats table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS stats (
-                key VARCHAR(50) PRIMARY KEY,
-                value INTEGER DEFAULT 0
-            )
-        """)
-        
-        cur.close()
-        logger.info("Database tables initialized")
-
-
-# ============================================
-# VIDEO FUNCTIONS
-# ============================================
-
-def generate_video_id() -> str:
-    """Generate unique video ID."""
-    chars = string.ascii_lowercase + string.digits
-    return "vid_" + ''.join(secrets.choice(chars) for _ in range(8))
-
-
-def save_video(source_channel: int, message_id: int, title: str, thumbnail_id: str = None) -> str:
-    """Save video to database and return unique ID."""
-    with get_db() as conn:
-        cur = conn.cursor()
-        video_id = generate_video_id()
-        
-        cur.execute("""
-            INSERT INTO videos (video_id, source_channel, message_id, title, thumbnail_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (video_id, source_channel, message_id, title, thumbnail_id))
-        
-        cur.close()
-        update_stats("total_videos", 1)
-        logger.info(f"Video saved: {video_id}")
-        return video_id
-
-
-def get_video(video_id: str) -> Optional[Dict]:
-    """Get video by ID."""
-    with get_db() as conn:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM videos WHERE video_id = %s", (video_id,))
-        result = cur.fetchone()
-        cur.close()
-        return dict(result) if result else None
-
-
-def delete_video(video_id: str) -> bool:
-    """Delete video from database."""
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM videos WHERE video_id = %s", (video_id,))
-        deleted = cur.rowcount > 0
-        cur.close()
-        return deleted
-
-
-def increment_downloads(video_id: str):
-    """Increment download count for video."""
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE videos SET downloads = downloads + 1 WHERE video_id = %s", (video_id,))
-        cur.close()
-        update_stats("total_downloads", 1)
-
-
-def get_all_videos() -> Dict:
-    """Get all videos."""
-    with get_db() as conn:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM videos ORDER BY created_at DESC")
-        results = cur.fetchall()
-        cur.close()
-        return {row['video_id']: dict(row) for row in results}
-
-
-# ============================================
-# USER FUNCTIONS
-# ============================================
-
-def get_user(user_id: int) -> Dict:
-    """Get or create user data."""
-    with get_db() as conn:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-        result = cur.fetchone()
-        
-        if not result:
-            cur.execute("INSERT INTO users (user_id) VALUES (%s) RETURNING *", (user_id,))
-            result = cur.fetchone()
-            update_stats("total_users", 1)
-        
-        cur.close()
-        return dict(result)
-
-
-def check_daily_limit(user_id: int, limit: int) -> tuple:
-    """Check if user is within daily limit."""
-    user = get_user(user_id)
-    today = date.today()
-    
-    if user.get("last_download_date") != today:
-        with get_db() as conn:
-            cur = conn.cursor()
-            cur.execute("UPDATE users SET downloads_today = 0, last_download_date = %s WHERE user_id = %s", (today, user_id))
-            cur.close()
-        user["downloads_today"] = 0
-    
-    remaining = limit - user["downloads_today"]
-    return remaining > 0, remaining
-
-
-def record_download(user_id: int):
-    """Record a download for user."""
-    with get_db() as conn:
-        cur = conn.cursor()
-        today = date.today()
-        cur.execute("""
-            UPDATE users SET downloads_today = downloads_today + 1, total_downloads = total_downloads + 1, last_download_date = %s
-            WHERE user_id = %s
-        """, (today, user_id))
-        cur.close()
-
-
-def get_all_users() -> Dict:
-    """Get all users."""
-    with get_db() as conn:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM users")
-        results = cur.fetchall()
-        cur.close()
-        return {str(row['user_id']): dict(row) for row in results}
-
-
-# ============================================
-# JOIN REQUESTS
-# ============================================
-
-def add_join_request(user_id: int, channel_id):
-    """Record a join request."""
-    try:
-        with get_db() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO join_requests (user_id, channel_id) VALUES (%s, %s)
-                ON CONFLICT (user_id, channel_id) DO NOTHING
-            """, (user_id, str(channel_id)))
-            cur.close()
-    except Exception as e:
-        logger.error(f"Error adding join request: {e}")
-
-
-def has_join_request(user_id: int, channel_id) -> bool:
-    """Check if user has a join request."""
-    try:
-        with get_db() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT 1 FROM join_requests WHERE user_id = %s AND channel_id = %s", (user_id, str(channel_id)))
-            result = cur.fetchone()
-            cur.close()
-            return result is not None
-    except Exception as e:
-        logger.error(f"Error checking join request: {e}")
-        return False
-
-
-def remove_join_request(user_id: int, channel_id):
-    """Remove join request."""
-    try:
-        with get_db() as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM join_requests WHERE user_id = %s AND channel_id = %s", (user_id, str(channel_id)))
-            cur.close()
-    except Exception as e:
-        logger.error(f"Error removing join request: {e}")
-
-
-# ============================================
-# STATS
-# ============================================
-
-def update_stats(key: str, increment: int = 1):
-    """Update a stat counter."""
-    try:
-        with get_db() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO stats (key, value) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE SET value = stats.value + %s
-            """, (key, increment, increment))
-            cur.close()
-    except Exception as e:
-        logger.error(f"Error updating stats: {e}")
-
-
-def get_stats() -> Dict:
-    """Get all stats."""
-    try:
-        with get_db() as conn:
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            cur.execute("SELECT * FROM stats")
-            results = cur.fetchall()
-            cur.close()
-            return {row['key']: row['value'] for row in results}
-    except:
-        return {}
-
-
-# Initialize on import
-try:
-    init_database()
-except Exception as e:
-    logger.error(f"Database init failed: {e}")
+"""
+Database utilities for PostgreSQL (Neon) storage
+Async access via an asyncpg connection pool
+"""
+
+import asyncio
+import time
+from collections import Counter
+from datetime import date
+from typing import Optional, Dict
+import secrets
+import logging
+
+import asyncpg
+
+from config import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Connection pool (created once at startup via init_pool)
+_pool: Optional[asyncpg.Pool] = None
+
+# Fail fast instead of queueing forever when the pool is saturated; a
+# caller stuck 5s on acquire is already serving a dead interaction
+ACQUIRE_TIMEOUT = 5
+
+# Write buffers: downloads and join requests are high-frequency one-row
+# writes, so they are queued here and flushed in batches by _flusher()
+FLUSH_INTERVAL = 3
+FLUSH_BATCH_SIZE = 500
+_download_q: asyncio.Queue = asyncio.Queue(maxsize=10000)
+_join_q: asyncio.Queue = asyncio.Queue(maxsize=10000)
+_flusher_task: Optional[asyncio.Task] = None
+
+
+async def init_pool() -> asyncpg.Pool:
+    """Create the connection pool and initialize tables."""
+    global _pool
+    if _pool is None:
+        # The DATABASE_URL points at Neon's pgbouncer pooler (transaction
+        # mode), so prepared statements must be fully disabled and
+        # session-scoped features (LISTEN/NOTIFY, advisory session locks)
+        # are unavailable. jit off avoids JIT warmup cost on the short
+        # queries this bot runs.
+        _pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=2,
+            max_size=32,
+            statement_cache_size=0,
+            max_cacheable_statement_size=0,
+            server_settings={"jit": "off"},
+        )
+        logger.info("Database connection pool created")
+        await init_database()
+    return _pool
+
+
+def get_pool() -> asyncpg.Pool:
+    """Get the connection pool (init_pool must have run)."""
+    return _pool
+
+
+async def close_pool():
+    """Close the connection pool."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+# ============================================
+# WRITE BATCHING
+# ============================================
+
+def _enqueue(queue: asyncio.Queue, item):
+    """Put item on a write queue, dropping the oldest entry on overflow."""
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        queue.put_nowait(item)
+
+
+def _drain(queue: asyncio.Queue, max_items: int = FLUSH_BATCH_SIZE) -> list:
+    """Take up to max_items off a queue without blocking."""
+    items = []
+    while len(items) < max_items:
+        try:
+            items.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    return items
+
+
+def start_flusher():
+    """Start the background task that flushes the write queues."""
+    global _flusher_task
+    if _flusher_task is None:
+        _flusher_task = asyncio.create_task(_flusher())
+        logger.info("Write flusher started")
+
+
+async def stop_flusher():
+    """Stop the flusher task and write out anything still queued."""
+    global _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        try:
+            await _flusher_task
+        except asyncio.CancelledError:
+            pass
+        _flusher_task = None
+    await flush_pending()
+
+
+async def _flusher():
+    """Periodically flush buffered writes in batches."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush_pending()
+        except Exception as e:
+            logger.error("Error flushing write buffers: %s", e)
+
+
+async def flush_pending():
+    """Flush queued downloads and join requests to the database."""
+    downloads = _drain(_download_q)
+    if downloads:
+        # Coalesce multiple downloads by the same user into one upsert.
+        # The single statement creates missing users, resets the daily
+        # counter on date rollover and increments atomically, so there
+        # is no read-then-write window.
+        counts = Counter(user_id for user_id, _ts in downloads)
+        today = date.today()
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO users (user_id, downloads_today, last_download_date, total_downloads)
+                    VALUES ($1, $2, $3, $2)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        downloads_today = CASE WHEN users.last_download_date = $3
+                                               THEN users.downloads_today + $2 ELSE $2 END,
+                        last_download_date = $3,
+                        total_downloads = users.total_downloads + $2
+                """, [(user_id, n, today) for user_id, n in counts.items()])
+
+    joins = _drain(_join_q)
+    if joins:
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO join_requests (user_id, channel_id) VALUES ($1, $2)
+                    ON CONFLICT (user_id, channel_id) DO NOTHING
+                """, joins)
+
+
+async def init_database():
+    """Initialize database tables (one batched DDL round-trip)."""
+    async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        async with conn.transaction():
+            # Transaction-scoped advisory lock: concurrently starting
+            # workers serialize here instead of racing the DDL. The
+            # xact variant is safe through pgbouncer transaction mode.
+            await conn.execute("SELECT pg_advisory_xact_lock(804251)")
+
+            # All tables and indexes in a single multi-statement execute.
+            # The videos index INCLUDEs the columns get_recent_videos
+            # selects so it serves index-only scans.
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id VARCHAR(20) PRIMARY KEY,
+                    source_channel BIGINT NOT NULL,
+                    message_id BIGINT NOT NULL,
+                    title VARCHAR(255),
+                    thumbnail_id VARCHAR(255),
+                    downloads INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id BIGINT PRIMARY KEY,
+                    joined_at DATE DEFAULT CURRENT_DATE,
+                    downloads_today INTEGER DEFAULT 0,
+                    last_download_date DATE,
+                    total_downloads INTEGER DEFAULT 0,
+                    is_premium BOOLEAN DEFAULT FALSE
+                );
+
+                CREATE TABLE IF NOT EXISTS join_requests (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    channel_id VARCHAR(100) NOT NULL,
+                    requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(user_id, channel_id)
+                );
+
+                CREATE TABLE IF NOT EXISTS stats (
+                    key VARCHAR(50) PRIMARY KEY,
+                    value INTEGER DEFAULT 0
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_users_last_dl ON users(last_download_date);
+
+                CREATE INDEX IF NOT EXISTS idx_videos_created_at
+                ON videos(created_at DESC) INCLUDE (video_id, title, downloads);
+            """)
+
+    logger.info("Database tables initialized")
+
+
+# ============================================
+# VIDEO FUNCTIONS
+# ============================================
+
+def generate_video_id() -> str:
+    """Generate unique video ID (one RNG draw, 8 hex chars)."""
+    return "vid_" + secrets.token_hex(4)
+
+
+async def save_video(source_channel: int, message_id: int, title: str, thumbnail_id: str = None, video_id: str = None) -> str:
+    """Save video and bump the total_videos stat in one round-trip.
+
+    Callers may pass a pre-generated video_id so the insert can run
+    concurrently with work that needs the id.
+    """
+    if video_id is None:
+        video_id = generate_video_id()
+
+    async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        await conn.execute("""
+            WITH ins AS (
+                INSERT INTO videos (video_id, source_channel, message_id, title, thumbnail_id)
+                VALUES ($1, $2, $3, $4, $5)
+            )
+            INSERT INTO stats (key, value) VALUES ('total_videos', 1)
+            ON CONFLICT (key) DO UPDATE SET value = stats.value + 1
+        """, video_id, source_channel, message_id, title, thumbnail_id)
+
+    logger.info("Video saved: %s", video_id)
+    return video_id
+
+
+async def get_video(video_id: str):
+    """Get the forwarding coordinates for a video, or None.
+
+    Fetches only the columns delivery needs and returns the asyncpg
+    Record as-is (it supports key access), skipping the per-row dict
+    copy on the hottest read path.
+    """
+    async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        return await conn.fetchrow(
+            "SELECT source_channel, message_id FROM videos WHERE video_id = $1",
+            video_id
+        )
+
+
+async def delete_video(video_id: str) -> bool:
+    """Delete video from database."""
+    async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        result = await conn.execute("DELETE FROM videos WHERE video_id = $1", video_id)
+        return result != "DELETE 0"
+
+
+async def increment_downloads(video_id: str):
+    """Increment video download count and the total_downloads stat in one round-trip."""
+    async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        await conn.execute("""
+            WITH upd AS (
+                UPDATE videos SET downloads = downloads + 1 WHERE video_id = $1
+            )
+            INSERT INTO stats (key, value) VALUES ('total_downloads', 1)
+            ON CONFLICT (key) DO UPDATE SET value = stats.value + 1
+        """, video_id)
+
+
+async def get_recent_videos(limit: int = 10) -> list:
+    """Get the most recent videos, newest first."""
+    async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        return await conn.fetch("""
+            SELECT video_id, title, downloads FROM videos
+            ORDER BY created_at DESC LIMIT $1
+        """, limit)
+
+
+# ============================================
+# USER FUNCTIONS
+# ============================================
+
+async def get_user(user_id: int) -> Dict:
+    """Get or create user data."""
+    async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        result = await conn.fetchrow("SELECT * FROM users WHERE user_id = $1", user_id)
+
+        if not result:
+            # Create the user and bump total_users in one statement
+            result = await conn.fetchrow("""
+                WITH ins AS (
+                    INSERT INTO users (user_id) VALUES ($1) RETURNING *
+                ), bump AS (
+                    INSERT INTO stats (key, value) VALUES ('total_users', 1)
+                    ON CONFLICT (key) DO UPDATE SET value = stats.value + 1
+                )
+                SELECT * FROM ins
+            """, user_id)
+
+        return dict(result)
+
+
+# In-process daily download counters: user_id -> (day, count). Kept in
+# step by record_download so the delivery path doesn't re-query the DB.
+_dl_counts: Dict[int, tuple] = {}
+
+
+async def check_daily_limit(user_id: int, limit: int) -> tuple:
+    """Check if user is within daily limit (served from the in-process counter)."""
+    today = date.today()
+    day, count = _dl_counts.get(user_id, (None, None))
+
+    if day != today or count is None:
+        count = await _fetch_today_count(user_id)
+        _dl_counts[user_id] = (today, count)
+
+    remaining = max(0, limit - count)
+    return count < limit, remaining
+
+
+async def _fetch_today_count(user_id: int) -> int:
+    """Get today's download count from the database, resetting on rollover."""
+    user = await get_user(user_id)
+    today = date.today()
+
+    if user.get("last_download_date") != today:
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            await conn.execute("UPDATE users SET downloads_today = 0, last_download_date = $1 WHERE user_id = $2", today, user_id)
+        return 0
+
+    return user["downloads_today"] or 0
+
+
+async def record_download(user_id: int):
+    """Record a download for user (buffered, flushed in batches)."""
+    today = date.today()
+    day, count = _dl_counts.get(user_id, (today, 0))
+    _dl_counts[user_id] = (today, (0 if day != today else count) + 1)
+    _enqueue(_download_q, (user_id, time.time()))
+
+
+# ============================================
+# JOIN REQUESTS
+# ============================================
+
+async def add_join_request(user_id: int, channel_id):
+    """Record a join request (buffered, flushed in batches)."""
+    _enqueue(_join_q, (user_id, str(channel_id)))
+
+
+async def has_join_request(user_id: int, channel_id) -> bool:
+    """Check if user has a join request."""
+    try:
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            result = await conn.fetchrow("SELECT 1 FROM join_requests WHERE user_id = $1 AND channel_id = $2", user_id, str(channel_id))
+            return result is not None
+    except Exception as e:
+        logger.error("Error checking join request: %s", e)
+        return False
+
+
+async def remove_join_request(user_id: int, channel_id):
+    """Remove join request."""
+    try:
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            await conn.execute("DELETE FROM join_requests WHERE user_id = $1 AND channel_id = $2", user_id, str(channel_id))
+    except Exception as e:
+        logger.error("Error removing join request: %s", e)
+
+
+# ============================================
+# STATS
+# ============================================
+
+async def update_stats(key: str, increment: int = 1):
+    """Update a stat counter."""
+    try:
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            await conn.execute("""
+                INSERT INTO stats (key, value) VALUES ($1, $2)
+                ON CONFLICT (key) DO UPDATE SET value = stats.value + $2
+            """, key, increment)
+    except Exception as e:
+        logger.error("Error updating stats: %s", e)
+
+
+async def get_dashboard_stats() -> Dict:
+    """Get all dashboard counters in one aggregate query."""
+    try:
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            row = await conn.fetchrow("""
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS total_users,
+                    (SELECT COUNT(*) FROM users WHERE last_download_date = CURRENT_DATE) AS active_today,
+                    (SELECT COUNT(*) FROM videos) AS total_videos,
+                    (SELECT COALESCE(SUM(downloads), 0) FROM videos) AS total_downloads
+            """)
+            return dict(row)
+    except Exception as e:
+        logger.error("Error fetching dashboard stats: %s", e)
+        return {}
+
+
+async def get_stats() -> Dict:
+    """Get all stats."""
+    try:
+        async with _pool.acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+            results = await conn.fetch("SELECT * FROM stats")
+            return {row['key']: row['value'] for row in results}
+    except Exception:
+        return {}
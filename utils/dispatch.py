@@ -0,0 +1,60 @@
+"""
+Per-chat dispatch queues
+
+Handlers wrapped with per_chat() are enqueued onto a queue keyed by chat
+and run by a dedicated worker task. A slow handler in one chat no longer
+blocks updates for other chats, while updates within a chat still run
+in order.
+"""
+
+import asyncio
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 32
+IDLE_TIMEOUT = 300  # evict a chat's worker after 5 min without updates
+
+_chat_queues: dict = {}
+_chat_tasks: dict = {}
+
+
+def per_chat(handler):
+    """Wrap a handler so it runs on its chat's worker queue."""
+    @functools.wraps(handler)
+    async def enqueue(update, context):
+        chat = update.effective_chat
+        if chat is None:
+            await handler(update, context)
+            return
+
+        chat_id = chat.id
+        queue = _chat_queues.get(chat_id)
+        if queue is None:
+            queue = _chat_queues[chat_id] = asyncio.Queue(QUEUE_SIZE)
+            _chat_tasks[chat_id] = asyncio.create_task(_worker(chat_id, queue))
+
+        await queue.put((handler, update, context))
+
+    return enqueue
+
+
+async def _worker(chat_id: int, queue: asyncio.Queue):
+    """Drain one chat's queue until it sits idle for IDLE_TIMEOUT."""
+    try:
+        while True:
+            try:
+                handler, update, context = await asyncio.wait_for(queue.get(), IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    break
+                continue
+
+            try:
+                await handler(update, context)
+            except Exception as e:
+                logger.error("Handler error in chat %s: %s", chat_id, e)
+    finally:
+        _chat_queues.pop(chat_id, None)
+        _chat_tasks.pop(chat_id, None)
@@ -2,14 +2,39 @@
 Common helper utilities
 """
 
-import re
+import functools
+import time
 from telegram import Update
-from config import ADMIN_IDS
+from config import ADMIN_ID_SET
 
 
 def is_admin(user_id: int) -> bool:
     """Check if user is an admin."""
-    return user_id in ADMIN_IDS
+    return user_id in ADMIN_ID_SET
+
+
+def skip_stale(max_age: int = 60):
+    """Decorator: drop updates older than max_age seconds.
+
+    When the bot catches up from a backlog, users no longer expect
+    replies to minutes-old taps, so stale updates are skipped instead
+    of burning throughput on them.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            date = None
+            if update.effective_message:
+                date = update.effective_message.date
+            elif update.chat_join_request:
+                date = update.chat_join_request.date
+
+            if date and time.time() - date.timestamp() > max_age:
+                return
+
+            await handler(update, context)
+        return wrapper
+    return decorator
 
 
 def get_user_id(update: Update) -> int:
@@ -28,24 +53,31 @@ def extract_video_id(text: str) -> str:
     return None
 
 
+# Markdown characters stripped from titles; str.translate with a table
+# is several times faster than re.sub for a plain character class
+_STRIP_MARKDOWN = str.maketrans('', '', '*_`[]')
+
+
 def sanitize_title(caption: str) -> str:
     """Extract clean title from caption."""
     if not caption:
         return "Untitled Video"
-    
+
     # Take first line or first 100 chars
     title = caption.split('\n')[0][:100]
-    
+
     # Remove markdown formatting
-    title = re.sub(r'[*_`\[\]]', '', title)
-    
+    title = title.translate(_STRIP_MARKDOWN)
+
     return title.strip() or "Untitled Video"
 
 
 def format_number(num: int) -> str:
     """Format number with K/M suffix."""
+    # The vast majority of values (per-user counts) are small; skip the
+    # float math entirely for them
+    if num < 1_000:
+        return str(num)
     if num >= 1_000_000:
-        return f"{num/1_000_000:.1f}M"
-    elif num >= 1_000:
-        return f"{num/1_000:.1f}K"
-    return str(num)
+        return f"{num // 100_000 / 10:.1f}M"
+    return f"{num // 100 / 10:.1f}K"
@@ -1,33 +1,39 @@
-"""
-Reply keyboard utilities
-"""
-
-from telegram import ReplyKeyboardMarkup, KeyboardButton
-
-
-def get_main_menu_keyboard() -> ReplyKeyboardMarkup:
-    """Get main menu keyboard for regular users."""
-    keyboard = [
-        [KeyboardButton("🔍 Search"), KeyboardButton("📊 My Stats")],
-        [KeyboardButton("👤 Profile"), KeyboardButton("❓ Help")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-
-def get_admin_keyboard() -> ReplyKeyboardMarkup:
-    """Get admin panel keyboard."""
-    keyboard = [
-        [KeyboardButton("📤 Post Stats"), KeyboardButton("👥 Users")],
-        [KeyboardButton("🎬 Videos"), KeyboardButton("⚙️ Settings")],
-        [KeyboardButton("🔙 Back to Main")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-
-def get_verification_keyboard() -> ReplyKeyboardMarkup:
-    """Get keyboard shown during verification."""
-    keyboard = [
-        [KeyboardButton("✅ I've Joined")],
-        [KeyboardButton("❓ Help")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+"""
+Reply keyboard utilities
+
+Keyboards are immutable, so the static ones are built once at import
+time instead of being reallocated on every reply.
+"""
+
+from telegram import ReplyKeyboardMarkup, KeyboardButton
+
+_MAIN_MENU = ReplyKeyboardMarkup([
+    [KeyboardButton("🔍 Search"), KeyboardButton("📊 My Stats")],
+    [KeyboardButton("👤 Profile"), KeyboardButton("❓ Help")]
+], resize_keyboard=True)
+
+_ADMIN_PANEL = ReplyKeyboardMarkup([
+    [KeyboardButton("📤 Post Stats"), KeyboardButton("👥 Users")],
+    [KeyboardButton("🎬 Videos"), KeyboardButton("⚙️ Settings")],
+    [KeyboardButton("🔙 Back to Main")]
+], resize_keyboard=True)
+
+_VERIFICATION = ReplyKeyboardMarkup([
+    [KeyboardButton("✅ I've Joined")],
+    [KeyboardButton("❓ Help")]
+], resize_keyboard=True)
+
+
+def get_main_menu_keyboard() -> ReplyKeyboardMarkup:
+    """Get main menu keyboard for regular users."""
+    return _MAIN_MENU
+
+
+def get_admin_keyboard() -> ReplyKeyboardMarkup:
+    """Get admin panel keyboard."""
+    return _ADMIN_PANEL
+
+
+def get_verification_keyboard() -> ReplyKeyboardMarkup:
+    """Get keyboard shown during verification."""
+    return _VERIFICATION
@@ -0,0 +1,76 @@
+"""
+Outbound send rate limiting.
+
+Telegram allows roughly 30 messages/second bot-wide and ~1 message/second
+to any single chat; past that it answers with RetryAfter flood errors,
+which cost far more than pacing the sends in the first place. Every
+outbound send goes through a global token bucket plus one bucket per
+destination chat.
+"""
+
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Kept a little under Telegram's published ceilings so normal jitter
+# doesn't trip flood control
+GLOBAL_RATE = 25        # messages/second across all chats
+PER_CHAT_RATE = 1.0     # messages/second to one chat
+PER_CHAT_BURST = 3      # short bursts to a chat are tolerated
+
+_CHAT_BUCKETS_MAX = 10_000
+
+
+class _TokenBucket:
+    """Minimal async token bucket; refills continuously at `rate`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_global_bucket = _TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+_chat_buckets = {}
+
+
+def _chat_bucket(chat_id: int) -> _TokenBucket:
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        if len(_chat_buckets) >= _CHAT_BUCKETS_MAX:
+            _chat_buckets.pop(next(iter(_chat_buckets)))
+        bucket = _chat_buckets[chat_id] = _TokenBucket(PER_CHAT_RATE, PER_CHAT_BURST)
+    return bucket
+
+
+async def send_limited(method, chat_id: int, **kwargs):
+    """Call a bot send method under the global and per-chat budgets.
+
+    If Telegram still answers with RetryAfter, honor it once with a
+    sleep-and-retry; a second flood error propagates to the caller.
+    """
+    await _chat_bucket(chat_id).acquire()
+    await _global_bucket.acquire()
+    try:
+        return await method(chat_id=chat_id, **kwargs)
+    except RetryAfter as e:
+        logger.warning("Flood control on chat %s: retrying in %ss", chat_id, e.retry_after)
+        await asyncio.sleep(e.retry_after + 0.5)
+        return await method(chat_id=chat_id, **kwargs)